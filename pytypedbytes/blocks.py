@@ -0,0 +1,341 @@
+"""
+Block-compressed framing of typed bytes streams.
+
+A framed stream is a sequence of blocks. Each block holds the typed
+bytes sequences of a whole number of objects, compressed together, and
+starts with a header:
+
+====== ==============================================
+Size   Field
+====== ==============================================
+4      The magic bytes "TBBK".
+1      The codec: 1 for zlib, 2 for bz2.
+4      The compressed size of the block, in bytes.
+4      The uncompressed size of the block, in bytes.
+4      The number of objects in the block.
+4      The CRC-32 checksum of the compressed bytes.
+====== ==============================================
+
+All integers are big-endian and unsigned. Blocks are compressed and
+decompressed by a pool of threads, since both codecs release the GIL,
+and are written and read in order.
+
+Since every block can be decoded on its own and its header gives its
+compressed size, a reader can skip blocks without decompressing them
+(see ``iterblocks``), and can start reading at the first block after an
+arbitrary offset (see ``find_block``), which allows a framed file to be
+split.
+"""
+
+import bz2
+import zlib
+from collections import deque, namedtuple
+from cStringIO import StringIO
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from .typedbytes import StreamStruct, dump, iterload, read_exactly
+
+
+block_magic = "TBBK"
+
+
+block_header_struct = StreamStruct(">4sBIIII")
+
+
+# Default number of uncompressed bytes after which a block is ended.
+default_block_size = 0x100000
+
+
+# Number of bytes read at a time when scanning for a block.
+scan_size = 0x10000
+
+
+class Codec(namedtuple("Codec", ["id", "name", "compress", "decompress",
+                                 "default_level"])):
+    """Compression codec of blocks."""
+    pass
+
+
+codecs = (
+    Codec(1, "zlib", zlib.compress, zlib.decompress, 6),
+    Codec(2, "bz2", bz2.compress, bz2.decompress, 9),
+    )
+
+
+def get_codec(name=None, id=None):
+    """Return the codec with the name *name* or the id *id*.
+
+    This function raises ValueError if there is no such codec."""
+    for codec in codecs:
+        if codec.name == name or codec.id == id:
+            return codec
+    raise ValueError("Unrecognized codec: %s" % (name if id is None else id))
+
+
+class BlockHeader(namedtuple("BlockHeader", [
+        "codec", "compressed_size", "size", "records", "crc"])):
+    """Header of a block of a framed stream."""
+    pass
+
+
+def read_block_header(fp):
+    """Read a block header from a readable file-like object *fp*.
+
+    This function returns None at the end of *fp*, and raises EOFError
+    if *fp* ends within the header or ValueError if the header is
+    invalid."""
+    string = fp.read(block_header_struct.size)
+    if not string:
+        return None
+    if len(string) != block_header_struct.size:
+        raise EOFError("Framed stream ended within a block header.")
+    fields = block_header_struct.unpack(string)
+    if fields[0] != block_magic:
+        raise ValueError("Invalid block header.")
+    return BlockHeader(get_codec(id=fields[1]), *fields[2:])
+
+
+def compress_block(codec, level, data, records):
+    """Compress the bytes *data* of *records* objects into a block,
+    returned as a (header, payload) pair of ``str`` instances."""
+    payload = codec.compress(data, level)
+    crc = zlib.crc32(payload) & 0xffffffff
+    header = block_header_struct.pack(
+        block_magic, codec.id, len(payload), len(data), records, crc)
+    return (header, payload)
+
+
+def decompress_block(header, payload):
+    """Check and decompress the compressed bytes *payload* of a block
+    with the BlockHeader *header*.
+
+    This function raises ValueError if the block is corrupt."""
+    if zlib.crc32(payload) & 0xffffffff != header.crc:
+        raise ValueError("Block checksum mismatch.")
+    data = header.codec.decompress(payload)
+    if len(data) != header.size:
+        raise ValueError("Block size mismatch.")
+    return data
+
+
+class BlockWriter(object):
+    """Serializes Python objects to a framed stream written to a
+    writeable file-like object *fp*.
+
+    Objects are serialized with *types* and grouped into blocks of about
+    *block_size* uncompressed bytes, which are compressed with the codec
+    named *codec* at compression level *level* by a pool of *threads*
+    threads. The number of threads defaults to the number of CPUs. The
+    ``close()`` method must be called to write the last block."""
+
+    def __init__(self, fp, types=None, codec="zlib", level=None,
+                 block_size=default_block_size, threads=None):
+        if threads is None:
+            threads = cpu_count()
+        self.fp = fp
+        self.types = types
+        self.codec = get_codec(codec)
+        self.level = self.codec.default_level if level is None else level
+        self.block_size = block_size
+        self.pool = ThreadPool(threads)
+        # At most this many blocks are compressed or waiting to be
+        # written at a time.
+        self.max_pending = 2 * threads
+        self.pending = deque()
+        self.buffer = StringIO()
+        self.records = 0
+
+    def dump(self, obj):
+        """Serialize *obj* to the current block.
+
+        If *obj* can not be serialized, the bytes already written for
+        it are discarded, and the block is left as it was."""
+        position = self.buffer.tell()
+        try:
+            dump(obj, self.buffer, self.types)
+        except:
+            self.buffer.seek(position)
+            self.buffer.truncate(position)
+            raise
+        self.records += 1
+        if self.buffer.tell() >= self.block_size:
+            self.end_block()
+
+    def end_block(self):
+        """Submit the current block for compression, writing completed
+        blocks as needed to bound the number of pending blocks."""
+        if not self.records:
+            return
+        args = (self.codec, self.level, self.buffer.getvalue(), self.records)
+        self.pending.append(self.pool.apply_async(compress_block, args))
+        self.buffer = StringIO()
+        self.records = 0
+        while len(self.pending) > self.max_pending:
+            self.write_block()
+
+    def write_block(self):
+        (header, payload) = self.pending.popleft().get()
+        self.fp.write(header)
+        self.fp.write(payload)
+
+    def close(self):
+        """Write the remaining blocks and stop the threads."""
+        try:
+            self.end_block()
+            while self.pending:
+                self.write_block()
+            self.fp.flush()
+        finally:
+            self.pool.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iterdump_blocks(fp, types=None, **kwargs):
+    """Coroutine function that serializes Python objects to a framed
+    stream written to a writeable file-like object *fp*.
+
+    Keyword arguments are passed to BlockWriter. The remaining blocks
+    are written when the coroutine is closed. This function returns the
+    coroutine after "priming" it by calling its ``.next()`` method
+    once."""
+    writer = BlockWriter(fp, types, **kwargs)
+    def _write_blocks():
+        try:
+            while True:
+                obj = (yield)
+                writer.dump(obj)
+        finally:
+            writer.close()
+    cr = _write_blocks()
+    cr.next()
+    return cr
+
+
+def iterread_blocks(fp, end=None):
+    """Generator function that reads (header, payload) pairs of blocks
+    from a readable file-like object *fp*, without decompressing them.
+
+    If *end* is not None, blocks that start at or after the offset *end*
+    are not read, and *fp* must be seekable."""
+    while True:
+        if end is not None and fp.tell() >= end:
+            return
+        header = read_block_header(fp)
+        if header is None:
+            return
+        payload = read_exactly(fp, header.compressed_size)
+        yield (header, payload)
+
+
+def iterload_blocks(fp, types=None, threads=None, start=None, end=None):
+    """Generator function that deserializes Python objects from a framed
+    stream read from a readable file-like object *fp*.
+
+    Blocks are decompressed by a pool of *threads* threads, which
+    defaults to the number of CPUs, and objects are deserialized with
+    *types* in the order in which they were written.
+
+    If *start* is not None, reading starts at the first block at or
+    after the offset *start*, as found by ``find_block``. Blocks that
+    start at or after the offset *end* are not read. Reading the splits
+    [0, a), [a, b), ... of a framed file thus reads every block once.
+    *fp* must be seekable if *start* or *end* is given."""
+    if threads is None:
+        threads = cpu_count()
+    if start is not None and find_block(fp, start) is None:
+        return
+    pool = ThreadPool(threads)
+    try:
+        pending = deque()
+        for (header, payload) in iterread_blocks(fp, end):
+            pending.append((header, pool.apply_async(
+                decompress_block, (header, payload))))
+            if len(pending) > 2 * threads:
+                (header, result) = pending.popleft()
+                for obj in load_block(result.get(), header, types):
+                    yield obj
+        while pending:
+            (header, result) = pending.popleft()
+            for obj in load_block(result.get(), header, types):
+                yield obj
+    finally:
+        pool.terminate()
+
+
+def load_block(data, header, types=None):
+    """Generator function that deserializes the objects of the
+    decompressed bytes *data* of a block with the BlockHeader *header*.
+
+    This function raises ValueError if the number of objects differs
+    from the one in *header*."""
+    records = 0
+    for obj in iterload(StringIO(data), types):
+        records += 1
+        yield obj
+    if records != header.records:
+        raise ValueError("Block record count mismatch.")
+
+
+def iterblocks(fp):
+    """Generator function that yields an (offset, header) pair for each
+    block of a framed stream read from a seekable file-like object *fp*.
+
+    Compressed bytes are skipped rather than read."""
+    while True:
+        offset = fp.tell()
+        header = read_block_header(fp)
+        if header is None:
+            return
+        fp.seek(header.compressed_size, 1)
+        yield (offset, header)
+
+
+def find_block(fp, offset):
+    """Find the first block that starts at or after the offset *offset*
+    of a framed stream read from a seekable file-like object *fp*.
+
+    A candidate block is accepted if its header is valid and its
+    checksum matches, without decompressing it. This function returns
+    the offset of the block, to which *fp* is positioned, or None if
+    there is no such block."""
+    fp.seek(0, 2)
+    file_size = fp.tell()
+    position = offset
+    while position < file_size:
+        fp.seek(position)
+        chunk = fp.read(scan_size)
+        i = chunk.find(block_magic)
+        if i < 0:
+            # The magic bytes may straddle the end of the chunk.
+            position += max(len(chunk) - len(block_magic) + 1, 1)
+            continue
+        candidate = position + i
+        fp.seek(candidate)
+        if is_block(fp, file_size - candidate):
+            fp.seek(candidate)
+            return candidate
+        position = candidate + 1
+    fp.seek(file_size)
+    return None
+
+
+def is_block(fp, remaining):
+    """Test whether a valid block starts at the current position of a
+    readable file-like object *fp*, with *remaining* bytes left in
+    it."""
+    try:
+        header = read_block_header(fp)
+    except (EOFError, ValueError):
+        return False
+    if header is None:
+        return False
+    if block_header_struct.size + header.compressed_size > remaining:
+        return False
+    payload = fp.read(header.compressed_size)
+    return zlib.crc32(payload) & 0xffffffff == header.crc
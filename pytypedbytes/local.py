@@ -0,0 +1,462 @@
+"""
+Local MapReduce runner for typed bytes jobs.
+
+This module runs the mapper, combiner and reducer of a Hadoop streaming
+job that uses typed bytes on a single machine, without Hadoop. Each
+stage runs as a pool of worker processes that exchange key/value
+streams of typed bytes through pipes and temporary files:
+
+- map: the input stream is dealt record by record to the mappers
+  through pipes. The output of each mapper is hash-partitioned by the
+  serialized bytes of its keys.
+- combine (optional): each partition of each mapper's output is sorted
+  and combined.
+- sort: the map outputs of each partition are sorted by key.
+- reduce: each sorted partition is reduced. The outputs of the
+  partitions are concatenated in partition order.
+
+Mappers, combiners and reducers are either Python callables or
+commands. A mapper callable is called as ``mapper(key, value)`` and a
+combiner or reducer callable is called as ``reducer(key, values)``,
+where *values* is an iterator; each returns an iterable of (key, value)
+pairs. A command (a ``str`` run by the shell, or a sequence of
+arguments) reads a key/value stream of typed bytes on its standard
+input and writes one on its standard output, like a Hadoop streaming
+program run with ``-io typedbytes``.
+
+Worker processes are forked, so callables do not need to be picklable.
+"""
+
+import errno
+import os
+import shutil
+import subprocess
+import time
+import traceback
+from collections import namedtuple
+from itertools import groupby, izip
+from multiprocessing import Process, Queue, cpu_count
+from operator import itemgetter
+from Queue import Empty
+from tempfile import mkdtemp
+from zlib import crc32
+
+from .sort import default_memory_limit, iterpairs_raw, write_sorted_pairs
+from .typedbytes import dumps, iterload, loads
+
+
+class StageStats(namedtuple("StageStats", [
+        "stage", "tasks", "records_in", "bytes_in", "records_out",
+        "bytes_out", "seconds"])):
+    """Throughput statistics of a stage of a local MapReduce job.
+
+    Records and bytes are counted as serialized (key, value) pairs, and
+    *seconds* is the wall-clock time of the stage."""
+
+    @property
+    def records_per_second(self):
+        return self.records_in / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes_in / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            "%s: %d tasks, %d records (%d bytes) in, %d records "
+            "(%d bytes) out, %.3f s, %.0f records/s, %.0f bytes/s" % (
+                self.stage, self.tasks, self.records_in, self.bytes_in,
+                self.records_out, self.bytes_out, self.seconds,
+                self.records_per_second, self.bytes_per_second))
+
+
+def run(in_fp, out_fp, mapper, reducer, combiner=None, num_mappers=None,
+        num_reducers=None, processes=None,
+        memory_limit=default_memory_limit, types=None):
+    """Run a MapReduce job on the key/value stream read from a readable
+    file-like object *in_fp*, writing the output of the reducers to a
+    writeable file-like object *out_fp*.
+
+    *num_mappers* mapper processes run concurrently, and the output is
+    split into *num_reducers* partitions. The combine, sort and reduce
+    stages run at most *processes* worker processes at a time. Each of
+    these numbers defaults to the number of CPUs. *memory_limit* is
+    passed to every sort of the combine and sort stages; see
+    ``pytypedbytes.sort.sort_pairs``. The keys and values passed to and
+    returned by mapper, combiner and reducer callables are deserialized
+    and serialized with *types*.
+
+    This function returns a list of StageStats instances, one for each
+    stage that was run. It raises RuntimeError if a worker fails, or if
+    a mapper stops reading its input before the end of the stream."""
+    if num_mappers is None:
+        num_mappers = cpu_count()
+    if num_reducers is None:
+        num_reducers = cpu_count()
+    if processes is None:
+        processes = cpu_count()
+    if min(num_mappers, num_reducers, processes) < 1:
+        raise ValueError(
+            "Numbers of mappers, reducers and processes must be positive.")
+    directory = mkdtemp(prefix="pytypedbytes-")
+    try:
+        job = Job(directory, num_mappers, num_reducers, processes,
+                  memory_limit, types)
+        stats = [job.map(in_fp, mapper)]
+        if combiner is not None:
+            stats.append(job.combine(combiner))
+        stats.append(job.sort())
+        stats.append(job.reduce(reducer))
+        for path in job.output_paths():
+            with open(path, "rb") as part_fp:
+                shutil.copyfileobj(part_fp, out_fp)
+        out_fp.flush()
+    finally:
+        shutil.rmtree(directory)
+    return stats
+
+
+class Job(object):
+    """Stages of a local MapReduce job whose intermediate files are
+    stored in *directory*, whose sorts are bounded by *memory_limit*,
+    and whose callables exchange objects serialized with *types*."""
+
+    def __init__(self, directory, num_mappers, num_reducers, processes,
+                 memory_limit=default_memory_limit, types=None):
+        self.directory = directory
+        self.num_mappers = num_mappers
+        self.num_reducers = num_reducers
+        self.processes = processes
+        self.memory_limit = memory_limit
+        self.types = types
+        # Statistics of the output of the last stage.
+        self.records = 0
+        self.bytes = 0
+
+    def path(self, stage, *indices):
+        name = "-".join([stage] + [str(i) for i in indices])
+        return os.path.join(self.directory, name)
+
+    def map_paths(self, r):
+        """Paths of the map outputs for partition *r*."""
+        return [self.path("map", m, r) for m in xrange(self.num_mappers)]
+
+    def output_paths(self):
+        return [self.path("reduce", r) for r in xrange(self.num_reducers)]
+
+    def stage_stats(self, stage, results, seconds):
+        records_out = sum(records for (records, _) in results)
+        bytes_out = sum(size for (_, size) in results)
+        stats = StageStats(stage, len(results), self.records, self.bytes,
+                           records_out, bytes_out, seconds)
+        self.records = records_out
+        self.bytes = bytes_out
+        return stats
+
+    def map(self, in_fp, mapper):
+        start = time.time()
+        pipes = [os.pipe() for _ in xrange(self.num_mappers)]
+        def map_task(m):
+            # Forked workers inherit every pipe; keep only our own
+            # readable end, so that end-of-file is seen.
+            for (i, (read_fd, write_fd)) in enumerate(pipes):
+                os.close(write_fd)
+                if i != m:
+                    os.close(read_fd)
+            with os.fdopen(pipes[m][0], "rb") as fp:
+                paths = [self.path("map", m, r)
+                         for r in xrange(self.num_reducers)]
+                return write_partitions(map_pairs(mapper, fp, self.types),
+                                        paths)
+        tasks = [lambda m=m: map_task(m) for m in xrange(self.num_mappers)]
+        runner = TaskRunner()
+        try:
+            for task in tasks:
+                runner.start(task)
+            for (read_fd, _) in pipes:
+                os.close(read_fd)
+            fps = [os.fdopen(write_fd, "wb") for (_, write_fd) in pipes]
+            # Mappers still reading their input, and mappers that stopped
+            # before the end of the stream.
+            live = range(self.num_mappers)
+            closed = set()
+            self.records = self.bytes = 0
+            try:
+                for (key, value) in iterpairs_raw(in_fp):
+                    if not live:
+                        break
+                    m = live[self.records % len(live)]
+                    try:
+                        fps[m].write(key)
+                        fps[m].write(value)
+                    except IOError as e:
+                        if e.errno != errno.EPIPE:
+                            raise
+                        # Keep feeding the other mappers, so that they
+                        # finish; the stage fails below.
+                        live.remove(m)
+                        closed.add(m)
+                        close_pipe(fps[m])
+                        continue
+                    self.records += 1
+                    self.bytes += len(key) + len(value)
+            finally:
+                for (m, fp) in enumerate(fps):
+                    if close_pipe(fp):
+                        closed.add(m)
+            results = runner.wait_all()
+        finally:
+            runner.terminate()
+        if closed:
+            raise RuntimeError(
+                "Mapper %d stopped reading its input before the end of the "
+                "stream" % min(closed))
+        return self.stage_stats("map", results, time.time() - start)
+
+    def combine(self, combiner):
+        start = time.time()
+        def combine_task(m, r):
+            path = self.path("map", m, r)
+            sorted_path = self.path("combine-sorted", m, r)
+            with open(path, "rb") as in_fp:
+                with open(sorted_path, "wb") as sorted_fp:
+                    write_sorted_pairs(iterpairs_raw(in_fp), sorted_fp,
+                                       self.memory_limit)
+            with open(sorted_path, "rb") as in_fp:
+                pairs = reduce_pairs(combiner, in_fp, self.types)
+                with open(path, "wb") as out_fp:
+                    result = write_pairs(pairs, out_fp)
+            os.remove(sorted_path)
+            return result
+        tasks = [lambda m=m, r=r: combine_task(m, r)
+                 for m in xrange(self.num_mappers)
+                 for r in xrange(self.num_reducers)]
+        results = run_tasks(tasks, self.processes)
+        return self.stage_stats("combine", results, time.time() - start)
+
+    def sort(self):
+        start = time.time()
+        def sort_task(r):
+            paths = self.map_paths(r)
+            in_fps = [open(path, "rb") for path in paths]
+            try:
+                pairs = CountedPairs(chain_pairs(in_fps))
+                with open(self.path("sort", r), "wb") as out_fp:
+                    write_sorted_pairs(pairs, out_fp, self.memory_limit)
+            finally:
+                for fp in in_fps:
+                    fp.close()
+            for path in paths:
+                os.remove(path)
+            return pairs.result()
+        tasks = [lambda r=r: sort_task(r) for r in xrange(self.num_reducers)]
+        results = run_tasks(tasks, self.processes)
+        return self.stage_stats("sort", results, time.time() - start)
+
+    def reduce(self, reducer):
+        start = time.time()
+        def reduce_task(r):
+            with open(self.path("sort", r), "rb") as in_fp:
+                pairs = reduce_pairs(reducer, in_fp, self.types)
+                with open(self.path("reduce", r), "wb") as out_fp:
+                    return write_pairs(pairs, out_fp)
+        tasks = [lambda r=r: reduce_task(r) for r in xrange(self.num_reducers)]
+        results = run_tasks(tasks, self.processes)
+        return self.stage_stats("reduce", results, time.time() - start)
+
+
+def map_pairs(mapper, fp, types=None):
+    """Generator function that applies a mapper callable or command to
+    the key/value stream read from a readable file *fp*, yielding
+    (key, value) pairs of typed bytes sequences.
+
+    The keys and values of a mapper callable are serialized with
+    *types*."""
+    if not callable(mapper):
+        for pair in run_command(mapper, fp):
+            yield pair
+        return
+    deserializer = iterload(fp, types)
+    for (key, value) in izip(deserializer, deserializer):
+        for (k, v) in mapper(key, value):
+            yield (dumps(k, types), dumps(v, types))
+
+
+def reduce_pairs(reducer, fp, types=None):
+    """Generator function that applies a reducer callable or command to
+    the sorted key/value stream read from a readable file *fp*, yielding
+    (key, value) pairs of typed bytes sequences.
+
+    Consecutive pairs are grouped by the serialized bytes of their
+    keys. The keys and values of a reducer callable are serialized with
+    *types*."""
+    if not callable(reducer):
+        for pair in run_command(reducer, fp):
+            yield pair
+        return
+    for (key, group) in groupby(iterpairs_raw(fp), itemgetter(0)):
+        values = (loads(value, types) for (_, value) in group)
+        for (k, v) in reducer(loads(key, types), values):
+            yield (dumps(k, types), dumps(v, types))
+
+
+def run_command(command, fp):
+    """Generator function that runs *command* with its standard input
+    read from the file *fp*, yielding the (key, value) pairs of typed
+    bytes sequences written to its standard output.
+
+    This function raises RuntimeError if the command fails."""
+    proc = subprocess.Popen(command, shell=isinstance(command, basestring),
+                            stdin=fp, stdout=subprocess.PIPE)
+    try:
+        for pair in iterpairs_raw(proc.stdout):
+            yield pair
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise RuntimeError(
+            "Command %r failed with exit status %d" % (command, returncode))
+
+
+def write_partitions(pairs, paths):
+    """Hash-partition (key, value) pairs of typed bytes sequences by the
+    CRC-32 checksum of their keys, writing them to the files *paths*.
+
+    This function returns the number of records and bytes written."""
+    fps = [open(path, "wb") for path in paths]
+    try:
+        records = size = 0
+        for (key, value) in pairs:
+            fp = fps[(crc32(key) & 0xffffffff) % len(fps)]
+            fp.write(key)
+            fp.write(value)
+            records += 1
+            size += len(key) + len(value)
+    finally:
+        for fp in fps:
+            fp.close()
+    return (records, size)
+
+
+def write_pairs(pairs, fp):
+    """Write (key, value) pairs of typed bytes sequences to a writeable
+    file-like object *fp*, returning the number of records and bytes
+    written."""
+    records = size = 0
+    for (key, value) in pairs:
+        fp.write(key)
+        fp.write(value)
+        records += 1
+        size += len(key) + len(value)
+    return (records, size)
+
+
+def chain_pairs(fps):
+    """Generator function that yields the (key, value) pairs of typed
+    bytes sequences read from each of the readable files *fps* in
+    turn."""
+    for fp in fps:
+        for pair in iterpairs_raw(fp):
+            yield pair
+
+
+class CountedPairs(object):
+    """Iterator over (key, value) pairs of typed bytes sequences that
+    counts the records and bytes that pass through it."""
+
+    def __init__(self, pairs):
+        self.pairs = iter(pairs)
+        self.records = 0
+        self.bytes = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        (key, value) = self.pairs.next()
+        self.records += 1
+        self.bytes += len(key) + len(value)
+        return (key, value)
+
+    def result(self):
+        return (self.records, self.bytes)
+
+
+def close_pipe(fp):
+    """Close the writeable end of a pipe, returning True if its reader
+    had already closed the other end."""
+    try:
+        fp.close()
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+        return True
+    return False
+
+
+def run_tasks(tasks, processes):
+    """Run the callables *tasks* in forked worker processes, at most
+    *processes* at a time, and return the list of their results."""
+    runner = TaskRunner()
+    try:
+        for task in tasks:
+            while len(runner.running) >= processes:
+                runner.wait_one()
+            runner.start(task)
+        return runner.wait_all()
+    finally:
+        runner.terminate()
+
+
+class TaskRunner(object):
+    """Runs callables in forked worker processes and collects their
+    results, which must be picklable."""
+
+    def __init__(self):
+        self.queue = Queue()
+        self.running = {}
+        self.results = []
+
+    def start(self, task):
+        index = len(self.results)
+        self.results.append(None)
+        process = Process(target=self.run_task, args=(index, task))
+        process.start()
+        self.running[index] = process
+
+    def run_task(self, index, task):
+        try:
+            result = task()
+        except BaseException:
+            self.queue.put((index, traceback.format_exc(), None))
+        else:
+            self.queue.put((index, None, result))
+
+    def wait_one(self):
+        while True:
+            try:
+                (index, error, result) = self.queue.get(timeout=0.1)
+            except Empty:
+                for process in self.running.itervalues():
+                    if process.exitcode not in (None, 0):
+                        raise RuntimeError(
+                            "Worker exited with exit code %d" %
+                            process.exitcode)
+                continue
+            self.running.pop(index).join()
+            if error is not None:
+                raise RuntimeError("Worker failed:\n%s" % error)
+            self.results[index] = result
+            return
+
+    def wait_all(self):
+        while self.running:
+            self.wait_one()
+        return self.results
+
+    def terminate(self):
+        for process in self.running.itervalues():
+            process.terminate()
+            process.join()
+        self.running.clear()
@@ -0,0 +1,159 @@
+"""
+Scatter-gather serialization of typed bytes.
+
+``SegmentWriter`` is a writeable file-like object that collects the
+bytes written to it as a list of segments instead of one contiguous
+buffer. Small writes, such as type codes and sizes, are packed together
+into shared segments, while large writes, such as the payloads of byte
+sequences, are kept by reference without being copied. The segments can
+be handed to the caller or written to a file descriptor with a single
+``writev(2)`` system call, so large payloads are never copied in user
+space.
+
+Python 2 does not provide ``os.writev``, so ``writev(2)`` is called
+through ``ctypes``.
+"""
+
+import ctypes
+import errno
+import os
+
+from .typedbytes import dump
+
+
+# Writes of at least this many bytes are kept as separate segments
+# rather than being copied into a shared segment.
+default_threshold = 4096
+
+
+# Maximum number of segments passed to a single writev(2) call.
+try:
+    iov_max = os.sysconf("SC_IOV_MAX")
+except (ValueError, OSError):
+    iov_max = 1024
+
+
+class SegmentWriter(object):
+    """Writeable file-like object that collects written bytes as a list
+    of segments.
+
+    Writes of at least *threshold* bytes are kept as references to the
+    written objects, which must not be mutated until the segments have
+    been consumed. Smaller writes are copied into shared segments. The
+    ``size`` attribute is the number of bytes written since the segments
+    were last consumed.
+
+    The ``flush()`` method does nothing, because ``dump`` calls it after
+    each nested object; the segments are consumed with ``segments()`` or
+    ``writev()`` instead."""
+
+    def __init__(self, threshold=default_threshold):
+        self.threshold = threshold
+        self.chunks = []
+        self.buffer = bytearray()
+        self.size = 0
+
+    def write(self, data):
+        size = len(data)
+        if size >= self.threshold:
+            self.end_buffer()
+            self.chunks.append(data)
+        elif size:
+            self.buffer += data
+        self.size += size
+
+    def flush(self):
+        pass
+
+    def end_buffer(self):
+        if self.buffer:
+            self.chunks.append(self.buffer)
+            self.buffer = bytearray()
+
+    def segments(self):
+        """Return the list of segments written so far, and reset the
+        writer."""
+        self.end_buffer()
+        chunks = self.chunks
+        self.chunks = []
+        self.size = 0
+        return chunks
+
+    def writev(self, fd):
+        """Write the segments written so far to the file descriptor
+        *fd*, and reset the writer."""
+        writev(fd, self.segments())
+
+
+def dump_segments(obj, types=None, threshold=default_threshold):
+    """Serialize *obj* to a list of segments whose concatenation is the
+    typed bytes sequence of *obj*.
+
+    Byte sequences of at least *threshold* bytes are referenced by the
+    segments without being copied."""
+    writer = SegmentWriter(threshold)
+    dump(obj, writer, types)
+    return writer.segments()
+
+
+def dumpv(obj, fd, types=None, threshold=default_threshold):
+    """Serialize *obj* to the file descriptor *fd* with ``writev(2)``.
+
+    Byte sequences of at least *threshold* bytes are written from their
+    own memory without being copied."""
+    writev(fd, dump_segments(obj, types, threshold))
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+libc = ctypes.CDLL(None, use_errno=True)
+libc.writev.argtypes = [ctypes.c_int, ctypes.POINTER(iovec), ctypes.c_int]
+libc.writev.restype = ctypes.c_ssize_t
+
+
+PyObject_AsReadBuffer = ctypes.pythonapi.PyObject_AsReadBuffer
+PyObject_AsReadBuffer.argtypes = [
+    ctypes.py_object,
+    ctypes.POINTER(ctypes.c_void_p),
+    ctypes.POINTER(ctypes.c_ssize_t),
+    ]
+PyObject_AsReadBuffer.restype = ctypes.c_int
+
+
+def buffer_address(obj):
+    """Return the address and size of the memory of an object that
+    supports the buffer interface, such as ``str``, ``bytearray`` or
+    ``buffer``, without copying it."""
+    address = ctypes.c_void_p()
+    size = ctypes.c_ssize_t()
+    PyObject_AsReadBuffer(obj, ctypes.byref(address), ctypes.byref(size))
+    return (address.value, size.value)
+
+
+def writev(fd, segments):
+    """Write all of the buffers *segments* to the file descriptor *fd*
+    with as few ``writev(2)`` system calls as possible.
+
+    Partial writes are resumed without copying the unwritten bytes."""
+    segments = [s for s in segments if len(s)]
+    start = 0
+    while start < len(segments):
+        batch = segments[start:start + iov_max]
+        vector = (iovec * len(batch))()
+        for (i, segment) in enumerate(batch):
+            vector[i].iov_base, vector[i].iov_len = buffer_address(segment)
+        written = libc.writev(fd, vector, len(batch))
+        if written < 0:
+            e = ctypes.get_errno()
+            if e == errno.EINTR:
+                continue
+            raise OSError(e, os.strerror(e))
+        # Skip the segments that were written completely, and resume a
+        # partially written segment at its first unwritten byte.
+        while written and written >= len(segments[start]):
+            written -= len(segments[start])
+            start += 1
+        if written:
+            segments[start] = buffer(segments[start], written)
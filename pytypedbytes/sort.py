@@ -0,0 +1,192 @@
+"""
+Sorting of typed bytes key/value streams.
+
+A key/value stream is a sequence of typed bytes values in which keys
+and values alternate, as written by Hadoop streaming jobs that use
+typed bytes. Keys are compared by their serialized bytes, without
+deserializing them, which matches the ordering that Hadoop applies to
+``TypedBytesWritable`` keys.
+"""
+
+import os
+import shutil
+import struct
+import sys
+from heapq import merge
+from tempfile import mkdtemp
+
+from .typedbytes import iterload_raw, iterpairs
+
+
+# Default estimated number of bytes of memory taken by the pairs held in
+# memory before a sorted run is spilled to a temporary file.
+default_memory_limit = 64 * 1024 * 1024
+
+
+# Default maximum number of spilled runs that are open at a time while
+# merging.
+default_max_open_runs = 64
+
+
+# Estimated number of bytes of memory taken by a (key, value) pair in a
+# run, besides the two ``str`` instances: the tuple and its list slot.
+pair_overhead = sys.getsizeof((None, None)) + struct.calcsize("P")
+
+
+def compare_raw(a, b):
+    """Compare the typed bytes sequences *a* and *b* of two keys.
+
+    The sequences are compared lexicographically as unsigned bytes, and
+    a sequence that is a prefix of another sorts first. The return value
+    follows the convention of the ``cmp`` builtin function."""
+    return cmp(str(a), str(b))
+
+
+def iterpairs_raw(fp):
+    """Return an iterator over the (key, value) pairs of typed bytes
+    sequences read from a readable file-like object *fp* without
+    deserializing them.
+
+    The iterator raises EOFError if *fp* ends after a key."""
+    deserializer = iterload_raw(fp)
+    return iterpairs(deserializer, deserializer.next)
+
+
+def sort_pairs(in_fp, out_fp, memory_limit=default_memory_limit,
+               max_open_runs=default_max_open_runs):
+    """Sort the key/value stream read from a readable file-like object
+    *in_fp* by key and write it to a writeable file-like object
+    *out_fp*.
+
+    Keys are ordered as by ``compare_raw``. The sort is stable: pairs
+    with equal keys are written in the order in which they were read.
+    When the pairs held in memory take an estimated *memory_limit* bytes,
+    they are sorted and spilled to a temporary file. When *in_fp* is
+    exhausted, the spilled runs are merged, at most *max_open_runs* at a
+    time; if there are more, consecutive runs are first merged into
+    intermediate runs, in as many passes as needed."""
+    write_sorted_pairs(iterpairs_raw(in_fp), out_fp, memory_limit,
+                       max_open_runs)
+
+
+def write_sorted_pairs(pairs, fp, memory_limit=default_memory_limit,
+                       max_open_runs=default_max_open_runs):
+    """Sort an iterable of (key, value) pairs of typed bytes sequences
+    by key and write them to a writeable file-like object *fp*.
+
+    See ``sort_pairs`` for the ordering and the meaning of
+    *memory_limit* and *max_open_runs*."""
+    if memory_limit <= 0:
+        raise ValueError("Memory limit must be positive.")
+    if max_open_runs < 2:
+        raise ValueError("Maximum number of open runs must be at least 2.")
+    directory = mkdtemp(prefix="pytypedbytes-sort-")
+    try:
+        run_paths = []
+        run = []
+        size = 0
+        for (key, value) in pairs:
+            run.append((key, value))
+            size += pair_size(key, value)
+            if size >= memory_limit:
+                sort_run(run)
+                run_paths.append(spill_run(run, directory, len(run_paths)))
+                run = []
+                size = 0
+        sort_run(run)
+        run_paths = merge_passes(run_paths, directory, max_open_runs)
+        run_fps = [open(path, "rb") for path in run_paths]
+        try:
+            # The last run is merged from memory, after the spilled runs
+            # that were read before it.
+            runs = [iterpairs_raw(run_fp) for run_fp in run_fps] + [run]
+            write_pairs(merge_runs(runs), fp)
+        finally:
+            for run_fp in run_fps:
+                run_fp.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def pair_size(key, value):
+    """Estimate the number of bytes of memory taken by a (key, value)
+    pair of typed bytes sequences held in a run."""
+    return sys.getsizeof(key) + sys.getsizeof(value) + pair_overhead
+
+
+def sort_run(pairs):
+    """Sort a list of (key, value) pairs of typed bytes sequences in
+    place by key."""
+    # list.sort is stable, so pairs with equal keys keep their order.
+    pairs.sort(key=lambda pair: pair[0])
+
+
+def spill_run(pairs, directory, index):
+    """Write (key, value) pairs of typed bytes sequences to a new file in
+    *directory*, and return its path."""
+    path = os.path.join(directory, "run-%d" % index)
+    with open(path, "wb") as fp:
+        write_pairs(pairs, fp)
+    return path
+
+
+def merge_passes(run_paths, directory, max_open_runs):
+    """Merge consecutive runs of the files *run_paths* in *directory*
+    into intermediate runs, at most *max_open_runs* at a time, until no
+    more than *max_open_runs* - 1 runs remain, leaving room for the run
+    held in memory. The paths of the remaining runs are returned in
+    order."""
+    index = len(run_paths)
+    while len(run_paths) >= max_open_runs:
+        merged_paths = []
+        for i in xrange(0, len(run_paths), max_open_runs):
+            group = run_paths[i:i + max_open_runs]
+            if len(group) == 1:
+                merged_paths.extend(group)
+                continue
+            path = os.path.join(directory, "run-%d" % index)
+            index += 1
+            merge_files(group, path)
+            merged_paths.append(path)
+        run_paths = merged_paths
+    return run_paths
+
+
+def merge_files(in_paths, out_path):
+    """Merge the sorted runs of the files *in_paths* into the file
+    *out_path*, removing them afterwards."""
+    in_fps = [open(path, "rb") for path in in_paths]
+    try:
+        with open(out_path, "wb") as out_fp:
+            runs = [iterpairs_raw(in_fp) for in_fp in in_fps]
+            write_pairs(merge_runs(runs), out_fp)
+    finally:
+        for in_fp in in_fps:
+            in_fp.close()
+    for path in in_paths:
+        os.remove(path)
+
+
+def merge_runs(runs):
+    """Merge sorted iterables of (key, value) pairs of typed bytes
+    sequences into one sorted iterator.
+
+    Pairs with equal keys are yielded in the order of *runs*, so merging
+    runs in the order in which they were read keeps the sort stable."""
+    if len(runs) == 1:
+        return iter(runs[0])
+    def entries(run_index, run):
+        # The run index breaks ties between equal keys, so that values
+        # are never compared.
+        for (key, value) in run:
+            yield (key, run_index, value)
+    iterables = [entries(i, run) for (i, run) in enumerate(runs)]
+    return ((key, value) for (key, _, value) in merge(*iterables))
+
+
+def write_pairs(pairs, fp):
+    """Write (key, value) pairs of typed bytes sequences to a writeable
+    file-like object *fp*."""
+    for (key, value) in pairs:
+        fp.write(key)
+        fp.write(value)
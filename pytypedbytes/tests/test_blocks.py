@@ -0,0 +1,101 @@
+# coding=utf-8
+
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from pytypedbytes import blocks
+
+
+class BlocksTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = [
+            (i, u"spam %d" % i, [float(i)] * (i % 7), {u"n": i % 3})
+            for i in xrange(2000)]
+
+    def dump_blocks(self, fp, **kwargs):
+        serializer = blocks.iterdump_blocks(fp, block_size=1000, threads=3,
+                                            **kwargs)
+        for obj in self.expected:
+            serializer.send(obj)
+        serializer.close()
+
+    def test_round_trip(self):
+        for codec in ("zlib", "bz2"):
+            fp = StringIO()
+            self.dump_blocks(fp, codec=codec)
+            fp.seek(0)
+            computed = list(blocks.iterload_blocks(fp, threads=2))
+            self.assertEqual(self.expected, computed)
+
+    def test_empty_stream(self):
+        fp = StringIO()
+        blocks.iterdump_blocks(fp).close()
+        self.assertEqual("", fp.getvalue())
+        self.assertEqual([], list(blocks.iterload_blocks(fp)))
+
+    def test_iterblocks(self):
+        fp = StringIO()
+        self.dump_blocks(fp)
+        fp.seek(0)
+        headers = list(blocks.iterblocks(fp))
+        self.assertTrue(len(headers) > 10)
+        self.assertEqual(len(self.expected),
+                         sum(header.records for (_, header) in headers))
+        self.assertEqual(0, headers[0][0])
+        self.assertEqual(len(fp.getvalue()), fp.tell())
+
+    def test_splits(self):
+        """Test that reading the splits of a framed file reads every
+        object once."""
+        fp = tempfile.TemporaryFile()
+        self.dump_blocks(fp)
+        size = fp.tell()
+        offsets = range(0, size, size // 7) + [size]
+        computed = []
+        for (start, end) in zip(offsets[:-1], offsets[1:]):
+            computed.extend(blocks.iterload_blocks(fp, start=start, end=end))
+        self.assertEqual(self.expected, computed)
+
+    def test_find_block_ignores_false_magic(self):
+        fp = StringIO()
+        self.dump_blocks(fp)
+        string = fp.getvalue()
+        fp = StringIO("xx" + blocks.block_magic + "garbage" + string)
+        self.assertEqual(len("xx" + blocks.block_magic + "garbage"),
+                         blocks.find_block(fp, 0))
+
+    def test_failed_dump_is_discarded(self):
+        """Test that the bytes of an object that fails to serialize do
+        not end up in the block."""
+        fp = StringIO()
+        writer = blocks.BlockWriter(fp, threads=1)
+        writer.dump([1, 2])
+        self.assertRaises(TypeError, writer.dump, [3, set()])
+        writer.dump(u"x")
+        writer.close()
+        fp.seek(0)
+        self.assertEqual([[1, 2], u"x"], list(blocks.iterload_blocks(fp)))
+        fp.seek(0)
+        headers = [header for (_, header) in blocks.iterblocks(fp)]
+        self.assertEqual([2], [header.records for header in headers])
+
+    def test_record_count_mismatch(self):
+        """Test that a block whose objects do not match the count in
+        its header is rejected."""
+        (header, payload) = blocks.compress_block(
+            blocks.get_codec("zlib"), 6, "\x03\x00\x00\x00\x01", 2)
+        fp = StringIO(header + payload)
+        self.assertRaises(ValueError, list, blocks.iterload_blocks(fp))
+
+    def test_corrupt_block(self):
+        fp = StringIO()
+        self.dump_blocks(fp)
+        string = fp.getvalue()
+        fp = StringIO(string[:100] + chr(ord(string[100]) ^ 1) + string[101:])
+        self.assertRaises(ValueError, list, blocks.iterload_blocks(fp))
+
+
+if __name__ == "__main__":
+    unittest.main()
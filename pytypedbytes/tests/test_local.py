@@ -0,0 +1,120 @@
+# coding=utf-8
+
+import unittest
+from StringIO import StringIO
+
+from pytypedbytes import local, typedbytes
+from pytypedbytes.tests.utils import dump_pairs, load_pairs
+
+
+def word_count_mapper(key, value):
+    for word in value.split():
+        yield (word, 1)
+
+
+def sum_reducer(key, values):
+    yield (key, sum(values))
+
+
+class LocalRunnerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        lines = [u"spam ham", u"eggs spam", u"spam spam eggs"] * 20
+        self.pairs = list(enumerate(lines))
+        self.word_counts = {u"spam": 80, u"ham": 20, u"eggs": 40}
+
+    def test_word_count(self):
+        out_fp = StringIO()
+        stats = local.run(dump_pairs(self.pairs), out_fp, word_count_mapper,
+                          sum_reducer, num_mappers=3, num_reducers=2,
+                          processes=2)
+        self.assertEqual(self.word_counts, dict(load_pairs(out_fp)))
+        self.assertEqual(["map", "sort", "reduce"],
+                         [s.stage for s in stats])
+        self.assertEqual(len(self.pairs), stats[0].records_in)
+        self.assertEqual(140, stats[0].records_out)
+        self.assertEqual(3, stats[-1].records_out)
+
+    def test_word_count_with_combiner(self):
+        out_fp = StringIO()
+        stats = local.run(dump_pairs(self.pairs), out_fp, word_count_mapper,
+                          sum_reducer, combiner=sum_reducer, num_mappers=2,
+                          num_reducers=3)
+        self.assertEqual(self.word_counts, dict(load_pairs(out_fp)))
+        self.assertEqual(["map", "combine", "sort", "reduce"],
+                         [s.stage for s in stats])
+        # Each mapper emits each word at most once after combining.
+        self.assertTrue(stats[1].records_out <= 2 * 3)
+
+    def test_memory_limit_applies_to_every_sort(self):
+        """Test that the memory limit of the job is passed to the sorts
+        of both the combine and the sort stages."""
+        write_sorted_pairs = local.write_sorted_pairs
+        def spy(pairs, fp, memory_limit):
+            # Runs in the forked workers, so failures surface as
+            # RuntimeError from the runner.
+            if memory_limit != 1000:
+                raise AssertionError("memory_limit=%d" % memory_limit)
+            write_sorted_pairs(pairs, fp, memory_limit)
+        local.write_sorted_pairs = spy
+        try:
+            out_fp = StringIO()
+            local.run(dump_pairs(self.pairs), out_fp, word_count_mapper,
+                      sum_reducer, combiner=sum_reducer, num_mappers=2,
+                      num_reducers=2, memory_limit=1000)
+        finally:
+            local.write_sorted_pairs = write_sorted_pairs
+        self.assertEqual(self.word_counts, dict(load_pairs(out_fp)))
+
+    def test_reducer_output_is_sorted_within_partition(self):
+        out_fp = StringIO()
+        identity = lambda key, value: [(key, value)]
+        local.run(dump_pairs(reversed(self.pairs)), out_fp, identity,
+                  lambda key, values: [(key, v) for v in values],
+                  num_reducers=1)
+        self.assertEqual(self.pairs, load_pairs(out_fp))
+
+    def test_commands(self):
+        out_fp = StringIO()
+        local.run(dump_pairs(self.pairs), out_fp, "cat", ["cat"],
+                  num_mappers=2, num_reducers=1)
+        self.assertEqual(self.pairs, load_pairs(out_fp))
+
+    def test_failing_mapper(self):
+        def failing_mapper(key, value):
+            raise ValueError("spam")
+        self.assertRaises(RuntimeError, local.run, dump_pairs(self.pairs),
+                          StringIO(), failing_mapper, sum_reducer,
+                          num_mappers=2)
+
+    def test_failing_command(self):
+        self.assertRaises(RuntimeError, local.run, dump_pairs(self.pairs),
+                          StringIO(), "cat > /dev/null; exit 3", sum_reducer,
+                          num_mappers=2)
+
+    def test_mapper_closing_input_early(self):
+        """Test that a mapper that exits successfully without reading its
+        whole input fails the job, rather than losing records."""
+        pairs = [(i, u"spam") for i in xrange(50000)]
+        self.assertRaises(RuntimeError, local.run, dump_pairs(pairs),
+                          StringIO(), "head -c 100 > /dev/null", sum_reducer,
+                          num_mappers=2)
+
+    def test_types(self):
+        """Test that the callables exchange objects serialized with the
+        types of the job."""
+        types = typedbytes.compact_types
+        out_fp = StringIO()
+        local.run(dump_pairs(self.pairs), out_fp, word_count_mapper,
+                  sum_reducer, combiner=sum_reducer, num_mappers=2,
+                  num_reducers=1, types=types)
+        self.assertEqual(self.word_counts, dict(load_pairs(out_fp)))
+        out_fp.seek(0)
+        # The counts fit in a byte.
+        self.assertEqual(
+            [1] * 3, [ord(value[0]) for value
+                      in typedbytes.iterload_raw(out_fp)][1::2])
+
+
+if __name__ == "__main__":
+    unittest.main()
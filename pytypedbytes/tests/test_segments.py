@@ -0,0 +1,65 @@
+# coding=utf-8
+
+import os
+import unittest
+
+from pytypedbytes import segments, typedbytes
+
+
+class SegmentsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = bytearray(os.urandom(100000))
+        self.obj = [1, (u"spam", self.payload), {"ham": self.payload}]
+
+    def test_dump_segments(self):
+        """Test that the concatenated segments equal the serialization
+        and that large payloads are referenced rather than copied."""
+        computed = segments.dump_segments(self.obj)
+        self.assertEqual(typedbytes.dumps(self.obj), "".join(
+            str(segment) for segment in computed))
+        referenced = [s for s in computed if s is self.payload]
+        self.assertEqual(2, len(referenced))
+        # Small writes are packed together between the payloads.
+        self.assertEqual(5, len(computed))
+
+    def test_dumpv(self):
+        (read_fd, write_fd) = os.pipe()
+        try:
+            # Keep the output smaller than the pipe buffer.
+            obj = [self.payload[:1000], u"spam", self.payload[:5000]]
+            segments.dumpv(obj, write_fd, threshold=100)
+            os.close(write_fd)
+            write_fd = None
+            with os.fdopen(read_fd, "rb") as fp:
+                read_fd = None
+                self.assertEqual(obj, typedbytes.load(fp))
+        finally:
+            for fd in (read_fd, write_fd):
+                if fd is not None:
+                    os.close(fd)
+
+    def test_writev_resumes_partial_writes(self):
+        """Test writing more segments than fit in one writev(2) call,
+        and more bytes than a pipe can hold at once."""
+        chunks = [str(i % 10) * 1000 for i in xrange(2 * segments.iov_max)]
+        (read_fd, write_fd) = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_fd)
+                segments.writev(write_fd, chunks)
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as fp:
+            computed = fp.read()
+        (_, status) = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+        self.assertEqual("".join(chunks), computed)
+
+
+if __name__ == "__main__":
+    unittest.main()
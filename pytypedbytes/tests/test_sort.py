@@ -0,0 +1,127 @@
+# coding=utf-8
+
+import os
+import random
+import resource
+import unittest
+from StringIO import StringIO
+
+from pytypedbytes import sort, typedbytes
+from pytypedbytes.tests.utils import dump_pairs, load_pairs
+
+
+class RawTestCase(unittest.TestCase):
+
+    def test_iterload_raw(self):
+        """Test that raw typed bytes sequences are exactly the
+        serializations of the values."""
+        expected = [
+            bytearray("\x0a\x0b\x0c"),
+            True,
+            -1,
+            1125899906842624L,
+            0.1,
+            u" śpăm\n ",
+            (-0.1, False, 27),
+            [-0.1, [False], 27],
+            {"ab": -0.1, "cd": (False,), True: 27},
+            ]
+        fp = StringIO("".join(typedbytes.dumps(obj) for obj in expected))
+        computed = list(typedbytes.iterload_raw(fp))
+        self.assertEqual([typedbytes.dumps(obj) for obj in expected],
+                         computed)
+
+    def test_iterload_raw_truncated(self):
+        string = typedbytes.dumps((1, 2, 3))
+        fp = StringIO(string[:-1])
+        self.assertRaises(EOFError, list, typedbytes.iterload_raw(fp))
+
+    def test_compare_raw(self):
+        a = typedbytes.dumps(u"a")
+        b = typedbytes.dumps(u"b")
+        self.assertEqual(-1, sort.compare_raw(a, b))
+        self.assertEqual(0, sort.compare_raw(a, a))
+        self.assertEqual(1, sort.compare_raw(b, a))
+        # Bytes compare as unsigned.
+        self.assertEqual(-1, sort.compare_raw("\x01", "\xff"))
+
+
+class SortPairsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.pairs = [(rng.randint(0, 50), i) for i in xrange(1000)]
+        key_bytes = lambda pair: typedbytes.dumps(pair[0])
+        # Python's sort is stable, so this is the expected order.
+        self.expected = sorted(self.pairs, key=key_bytes)
+
+    def test_sort_in_memory(self):
+        out_fp = StringIO()
+        sort.sort_pairs(dump_pairs(self.pairs), out_fp)
+        self.assertEqual(self.expected, load_pairs(out_fp))
+
+    def test_sort_with_spilled_runs(self):
+        out_fp = StringIO()
+        sort.sort_pairs(dump_pairs(self.pairs), out_fp, memory_limit=100)
+        self.assertEqual(self.expected, load_pairs(out_fp))
+
+    def test_sort_with_bounded_open_runs(self):
+        """Test that spilled runs are merged in several passes when
+        there are more of them than may be open at a time."""
+        out_fp = StringIO()
+        sort.sort_pairs(dump_pairs(self.pairs), out_fp, memory_limit=100,
+                        max_open_runs=3)
+        self.assertEqual(self.expected, load_pairs(out_fp))
+
+    def test_sort_within_open_file_limit(self):
+        """Test sorting many spilled runs in a process that may only
+        open a few more files."""
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                open_fds = len(os.listdir("/proc/self/fd"))
+                (_, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+                resource.setrlimit(resource.RLIMIT_NOFILE,
+                                   (open_fds + 8, hard))
+                out_fp = StringIO()
+                sort.sort_pairs(dump_pairs(self.pairs), out_fp,
+                                memory_limit=100, max_open_runs=4)
+                if self.expected == load_pairs(out_fp):
+                    status = 0
+            finally:
+                os._exit(status)
+        (_, status) = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+
+    def test_memory_limit_counts_pair_overhead(self):
+        """Test that a run is spilled once the estimated memory of its
+        pairs, not only their bytes, reaches the memory limit."""
+        pairs = [(typedbytes.dumps(i), typedbytes.dumps(i))
+                 for i in xrange(10)]
+        limit = sort.pair_size(*pairs[0]) * 5
+        self.assertTrue(limit > 5 * 2 * len(pairs[0][0]) * 4)
+        spilled = []
+        spill_run = sort.spill_run
+        def spy(run, directory, index):
+            spilled.append(len(run))
+            return spill_run(run, directory, index)
+        sort.spill_run = spy
+        try:
+            sort.write_sorted_pairs(pairs, StringIO(), memory_limit=limit)
+        finally:
+            sort.spill_run = spill_run
+        self.assertEqual([5, 5], spilled)
+
+    def test_sort_empty_stream(self):
+        out_fp = StringIO()
+        sort.sort_pairs(StringIO(), out_fp, memory_limit=100)
+        self.assertEqual("", out_fp.getvalue())
+
+    def test_sort_odd_stream(self):
+        in_fp = StringIO(typedbytes.dumps(1))
+        self.assertRaises(EOFError, sort.sort_pairs, in_fp, StringIO())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@
 
 import unittest
 import struct
+import tempfile
 from collections import namedtuple
 from math import isnan
 from StringIO import StringIO
@@ -136,6 +137,266 @@ class TypedBytesTestCase(unittest.TestCase):
         self.assertEqual(expected[0], deserializer.next())
         self.assertRaises(ValueError, deserializer.next)
 
+    def test_compact_types_round_trip(self):
+        """Test that numbers serialized with ``compact_types`` use the
+        smallest exact type code and deserialize with the default
+        types."""
+        cases = [
+            (0, 1),
+            (-128, 1),
+            (128, 3),
+            (-0x80000000, 3),
+            (0x80000000, 4),
+            (5L, 1),
+            (True, 2),
+            (0.5, 5),
+            (float('inf'), 5),
+            (0.1, 6),
+            (1e300, 6),
+            ]
+        for (obj, type_code) in cases:
+            string = typedbytes.dumps(obj, typedbytes.compact_types)
+            self.assertEqual(type_code, ord(string[0]))
+            self.assertEqual(obj, typedbytes.loads(string))
+        expected = [(1, 2.5, 1e300), [300, -0.25], {7: 0x100000000L}]
+        for obj in expected:
+            string = typedbytes.dumps(obj, typedbytes.compact_types)
+            self.assertTrue(len(string) < len(typedbytes.dumps(obj)))
+            self.assertEqual(obj, typedbytes.loads(string))
+
+    def test_compact_types_derive_from_default_types(self):
+        """Test that every default type definition other than those of
+        ``int`` and ``long`` is kept, in order, by ``compact_types``."""
+        self.assertEqual(
+            [t for t in typedbytes.default_types
+             if t.type not in (int, long)],
+            [t for t in typedbytes.compact_types
+             if t in typedbytes.default_types])
+
+    def test_compact_types_NaN_round_trip(self):
+        obj = float('nan')
+        string = typedbytes.dumps(obj, typedbytes.compact_types)
+        self.assertEqual(5, ord(string[0]))
+        self.assertTrue(isnan(typedbytes.loads(string)))
+
+
+class RawTypedBytesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.value = {u"spam": [1, (2.5, bytearray("ab"))], 3: u"eggs"}
+        self.string = typedbytes.dumps(self.value)
+
+    def test_raw_round_trip(self):
+        """Test that raw values are written verbatim."""
+        raw = typedbytes.loads(self.string, typedbytes.raw_types())
+        self.assertEqual(typedbytes.RawTypedBytes(self.string), raw)
+        self.assertEqual(10, raw.type_code)
+        self.assertEqual(self.value, raw.load())
+        self.assertEqual(self.string, typedbytes.dumps(raw))
+        self.assertEqual(typedbytes.dumps([self.value]),
+                         typedbytes.dumps([raw]))
+
+    def test_raw_below_depth(self):
+        types = typedbytes.raw_types(2)
+        computed = typedbytes.loads(self.string, types)
+        self.assertEqual(set([u"spam", 3]), set(computed))
+        self.assertEqual(u"eggs", computed[3])
+        # Elements of the nested list are 2 levels deep.
+        self.assertEqual(typedbytes.dumps(1), computed[u"spam"][0].data)
+        nested = computed[u"spam"][1]
+        self.assertEqual(typedbytes.dumps((2.5, bytearray("ab"))),
+                         nested.data)
+        self.assertEqual(self.string, typedbytes.dumps(computed))
+
+    def test_iterload_pairs_with_raw_values(self):
+        pairs = [(u"a", self.value), (7, [1, 2]), (u"b", 0.5)]
+        fp = StringIO("".join(typedbytes.dumps(k) + typedbytes.dumps(v)
+                              for (k, v) in pairs))
+        computed = list(typedbytes.iterload_pairs(
+            fp, value_types=typedbytes.raw_types()))
+        self.assertEqual([k for (k, _) in pairs], [k for (k, _) in computed])
+        self.assertEqual([typedbytes.dumps(v) for (_, v) in pairs],
+                         [v.data for (_, v) in computed])
+
+    def test_iterload_pairs_ended_after_key(self):
+        fp = StringIO(typedbytes.dumps(u"a"))
+        self.assertRaises(EOFError, list, typedbytes.iterload_pairs(fp))
+
+
+class StreamingTestCase(unittest.TestCase):
+
+    def test_streaming_read(self):
+        """Test reading nested containers incrementally."""
+        expected = [
+            (1, [2, (3, 4)], {u"a": [5]}),
+            [u"spam", {}],
+            7,
+            ]
+        fp = StringIO("".join(typedbytes.dumps(obj) for obj in expected))
+        records = typedbytes.iterload_streaming(fp)
+        vector = records.next()
+        self.assertTrue(isinstance(vector, typedbytes.VectorStream))
+        self.assertEqual(3, vector.size)
+        elements = iter(vector)
+        self.assertEqual(1, elements.next())
+        nested_list = elements.next()
+        self.assertTrue(isinstance(nested_list, typedbytes.ListStream))
+        self.assertEqual(2, iter(nested_list).next())
+        # Advancing the vector consumes the rest of the nested list.
+        nested_map = elements.next()
+        self.assertTrue(isinstance(nested_map, typedbytes.MapStream))
+        (key, value) = iter(nested_map).next()
+        self.assertEqual(u"a", key)
+        self.assertEqual([5], list(value))
+        self.assertRaises(StopIteration, elements.next)
+        # Advancing the records consumes the rest of the list.
+        self.assertTrue(isinstance(records.next(), typedbytes.ListStream))
+        self.assertEqual(7, records.next())
+        self.assertRaises(StopIteration, records.next)
+
+    def test_streaming_write(self):
+        size = 1000
+        obj = typedbytes.VectorStream(size, (i * 2 for i in xrange(size)))
+        self.assertEqual(typedbytes.dumps(tuple(xrange(0, 2 * size, 2))),
+                         typedbytes.dumps(obj))
+        obj = typedbytes.MapStream(2, iter([(u"a", 1), (u"b", [2])]))
+        self.assertEqual({u"a": 1, u"b": [2]},
+                         typedbytes.loads(typedbytes.dumps(obj)))
+        obj = typedbytes.ListStream(iter([1, 2]))
+        self.assertEqual([1, 2], typedbytes.loads(typedbytes.dumps(obj)))
+
+    def test_streaming_write_wrong_size(self):
+        obj = typedbytes.VectorStream(2, iter([1, 2, 3]))
+        self.assertRaises(ValueError, typedbytes.dumps, obj)
+        obj = typedbytes.MapStream(2, iter([(1, 2)]))
+        self.assertRaises(ValueError, typedbytes.dumps, obj)
+
+    def test_streaming_pass_through(self):
+        """Test that streamed containers can be serialized as they are
+        read."""
+        expected = {u"a": (1, [2, 3]), u"b": (4.0, {5: 6})}
+        fp = StringIO(typedbytes.dumps(expected))
+        obj = typedbytes.iterload_streaming(fp).next()
+        self.assertEqual(expected, typedbytes.loads(typedbytes.dumps(obj)))
+
+
+class LimitsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = [
+            bytearray("x" * 100),
+            u" śpăm\n " * 10,
+            (1, [2, 3], {u"a": bytearray("b")}),
+            ]
+        self.string = "".join(typedbytes.dumps(obj) for obj in self.expected)
+
+    def load_all(self, limits, fp=None):
+        if fp is None:
+            fp = StringIO(self.string)
+        return list(typedbytes.iterload(fp, limits=limits))
+
+    def test_within_limits(self):
+        limits = typedbytes.Limits(element_size=100, container_length=3,
+                                   record_size=105)
+        self.assertEqual(self.expected, self.load_all(limits))
+
+    def test_readinto(self):
+        """Test reading from a file-like object with ``readinto()``."""
+        fp = tempfile.TemporaryFile()
+        fp.write(self.string)
+        fp.seek(0)
+        self.assertEqual(self.expected,
+                         self.load_all(typedbytes.Limits(), fp))
+
+    def test_element_size_exceeded(self):
+        limits = typedbytes.Limits(element_size=99)
+        self.assertRaises(typedbytes.LimitExceededError, self.load_all,
+                          limits)
+
+    def test_container_length_exceeded(self):
+        limits = typedbytes.Limits(container_length=2)
+        self.assertRaises(typedbytes.LimitExceededError, self.load_all,
+                          limits)
+        string = typedbytes.dumps([1, 2, 3])
+        self.assertRaises(typedbytes.LimitExceededError, typedbytes.loads,
+                          string, limits=limits)
+
+    def test_container_length_exceeded_by_raw_values(self):
+        limits = typedbytes.Limits(container_length=2)
+        for obj in ((1, 2, 3), [1, 2, 3], {1: 1, 2: 2, 3: 3}):
+            self.assertRaises(typedbytes.LimitExceededError, typedbytes.loads,
+                              typedbytes.dumps(obj), typedbytes.raw_types(),
+                              limits)
+
+    def test_container_length_exceeded_by_streams(self):
+        limits = typedbytes.Limits(container_length=2)
+        types = typedbytes.streaming_types()
+        for obj in ((1, 2, 3), {1: 1, 2: 2, 3: 3}):
+            self.assertRaises(typedbytes.LimitExceededError, typedbytes.loads,
+                              typedbytes.dumps(obj), types, limits)
+        stream = typedbytes.loads(typedbytes.dumps([1, 2, 3]), types, limits)
+        self.assertRaises(typedbytes.LimitExceededError, list, stream)
+
+    def test_record_size_exceeded(self):
+        limits = typedbytes.Limits(record_size=104)
+        self.assertRaises(typedbytes.LimitExceededError, self.load_all,
+                          limits)
+
+    def test_hostile_size(self):
+        """Test that a huge declared size is rejected before it is
+        read."""
+        string = "\x00\x7f\xff\xff\xff"
+        limits = typedbytes.Limits(element_size=1000)
+        self.assertRaises(typedbytes.LimitExceededError, typedbytes.loads,
+                          string, limits=limits)
+        limits = typedbytes.Limits(record_size=1000)
+        self.assertRaises(typedbytes.LimitExceededError, typedbytes.loads,
+                          string, limits=limits)
+
+    def test_hostile_size_is_not_allocated(self):
+        """Test that the record size limit rejects a huge declared size
+        before any buffer of that size is allocated."""
+        allocations = []
+        def spy(*args):
+            allocations.append(args)
+            return bytearray(*args)
+        limits = typedbytes.Limits(record_size=1000)
+        typedbytes.bytearray = spy
+        try:
+            for type_code in ("\x00", "\x07"):
+                string = type_code + "\x7f\xff\xff\xff"
+                self.assertRaises(typedbytes.LimitExceededError,
+                                  typedbytes.loads, string, limits=limits)
+        finally:
+            del typedbytes.bytearray
+        self.assertEqual([], allocations)
+
+    def test_large_string_is_decoded_in_chunks(self):
+        """Test decoding a string larger than the pooled buffers, with
+        multibyte characters split across buffers, and that no large
+        buffer is kept in the pool."""
+        expected = u"aśpăm" * 1000
+        string = typedbytes.dumps(expected)
+        fp = StringIO(string + string)
+        reader = typedbytes.BoundedReader(
+            fp, typedbytes.Limits(),
+            typedbytes.BufferPool(max_buffer_size=7))
+        self.assertEqual(expected, typedbytes.load(reader))
+        self.assertEqual(expected, typedbytes.load(reader))
+        self.assertEqual([7], [len(b) for b in reader.pool.buffers])
+
+    def test_buffer_pool_drops_large_buffers(self):
+        pool = typedbytes.BufferPool(max_buffer_size=100)
+        pool.release(pool.acquire(1000))
+        self.assertEqual([], pool.buffers)
+        pool.release(pool.acquire(100))
+        self.assertEqual(1, len(pool.buffers))
+
+    def test_truncated_element(self):
+        string = typedbytes.dumps(u"spam")[:-1]
+        self.assertRaises(EOFError, typedbytes.loads, string,
+                          limits=typedbytes.Limits())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,24 @@
+from StringIO import StringIO
+
+from pytypedbytes import typedbytes
+
+
+def dump_pairs(pairs):
+    """Serialize (key, value) pairs to a key/value stream in a
+    ``StringIO`` instance, positioned at its start."""
+    fp = StringIO()
+    serializer = typedbytes.iterdump(fp)
+    for (key, value) in pairs:
+        serializer.send(key)
+        serializer.send(value)
+    serializer.close()
+    fp.seek(0)
+    return fp
+
+
+def load_pairs(fp):
+    """Deserialize the (key, value) pairs of the key/value stream in a
+    file-like object *fp*, from its start."""
+    fp.seek(0)
+    deserializer = typedbytes.iterload(fp)
+    return list(zip(deserializer, deserializer))
@@ -1,4 +1,5 @@
 from collections import namedtuple
+from codecs import utf_8_decode
 from cStringIO import StringIO
 from itertools import islice
 from math import isnan
@@ -53,6 +54,323 @@ class EndOfList(object):
     pass
 
 
+class ValueCheckedType(type):
+    """Metaclass for classes that recognize instances by value rather
+    than by type.
+
+    ``isinstance(obj, cls)`` returns the result of ``cls.check(obj)``.
+    Such classes can be used in the 'type' field of a type definition
+    to select a type code that depends on the value of an object."""
+
+    def __instancecheck__(cls, obj):
+        return cls.check(obj)
+
+
+class CompactByte(object):
+    """Abstract class of integers that fit in a signed byte."""
+    __metaclass__ = ValueCheckedType
+
+    @staticmethod
+    def check(obj):
+        return (isinstance(obj, (int, long)) and
+                not isinstance(obj, bool) and
+                obj >= -0x80 and obj < +0x80)
+
+
+class CompactInteger(object):
+    """Abstract class of integers that fit in a 32-bit signed
+    integer."""
+    __metaclass__ = ValueCheckedType
+
+    @staticmethod
+    def check(obj):
+        return (isinstance(obj, (int, long)) and
+                not isinstance(obj, bool) and
+                obj >= -0x80000000 and obj < +0x80000000)
+
+
+class CompactFloat(object):
+    """Abstract class of ``float`` instances that are exactly
+    representable as 32-bit signed IEEE floating point numbers."""
+    __metaclass__ = ValueCheckedType
+
+    @staticmethod
+    def check(obj):
+        return isinstance(obj, float) and is_exact_float(obj)
+
+
+class RawTypedBytes(object):
+    """Typed bytes sequence of one value, carried without being
+    deserialized.
+
+    The *data* attribute is the complete ``str`` sequence, including the
+    type code. ``dump`` writes it verbatim, so values that are only
+    passed through are never deserialized or reserialized. Instances
+    are returned by loaders built with ``raw_types``."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def type_code(self):
+        return ord(self.data[0])
+
+    def load(self, types=None):
+        """Deserialize the typed bytes sequence to a Python object."""
+        return loads(self.data, types)
+
+    def __eq__(self, other):
+        return isinstance(other, RawTypedBytes) and self.data == other.data
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.data)
+
+    def __repr__(self):
+        return "RawTypedBytes(%r)" % self.data
+
+
+class ContainerStream(object):
+    """Container whose elements are produced by an iterator rather than
+    held in memory.
+
+    Instances are returned by loaders built with ``streaming_types``,
+    which read the elements from the stream as they are iterated, and
+    can be created by applications to serialize elements from a
+    generator. A container stream can be iterated only once."""
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+
+    def __iter__(self):
+        return self.iterator
+
+    def skip(self):
+        """Consume the remaining elements of the container."""
+        for _ in self.iterator:
+            pass
+
+
+class VectorStream(ContainerStream):
+    """Vector of *size* elements produced by *iterable*."""
+
+    def __init__(self, size, iterable):
+        super(VectorStream, self).__init__(iterable)
+        self.size = size
+
+
+class ListStream(ContainerStream):
+    """List of the elements produced by *iterable*."""
+    pass
+
+
+class MapStream(ContainerStream):
+    """Map of *size* (key, value) pairs produced by *iterable*."""
+
+    def __init__(self, size, iterable):
+        super(MapStream, self).__init__(iterable)
+        self.size = size
+
+
+def skip_stream(obj):
+    """Consume the remaining elements of *obj* if it is a container
+    stream."""
+    if isinstance(obj, ContainerStream):
+        obj.skip()
+
+
+class LimitExceededError(ValueError):
+    """Exception raised when deserialized typed bytes exceed one of the
+    limits of a Limits instance."""
+    pass
+
+
+class Limits(namedtuple("Limits", [
+        "element_size", "container_length", "record_size"])):
+    """Limits on deserialized typed bytes. A limit of None is not
+    enforced.
+
+    - *element_size* is the maximum number of bytes of a sequence of
+      bytes or a string.
+    - *container_length* is the maximum number of elements of a vector
+      or list, or of items of a map.
+    - *record_size* is the maximum number of bytes of a top-level
+      object.
+
+    Limits are checked before the bytes are read, so a corrupt or
+    hostile size can not cause a large allocation. They also apply to
+    raw values and to container streams."""
+
+    def __new__(cls, element_size=None, container_length=None,
+                record_size=None):
+        return super(Limits, cls).__new__(
+            cls, element_size, container_length, record_size)
+
+
+# Maximum number of bytes read by a single call to the ``readinto()``
+# or ``read()`` method of a bounded file-like object.
+read_chunk_size = 0x10000
+
+
+class BufferPool(object):
+    """Pool of reusable ``bytearray`` buffers.
+
+    At most *max_buffers* released buffers of at most *max_buffer_size*
+    bytes each are kept for reuse; larger buffers are dropped, so that
+    the pool never pins more than ``max_buffers * max_buffer_size``
+    bytes."""
+
+    def __init__(self, max_buffers=4, max_buffer_size=read_chunk_size):
+        if max_buffer_size < 4:
+            # A buffer must hold any partial UTF-8 character and at
+            # least one more byte; see ``BoundedReader.read_unicode``.
+            raise ValueError("Maximum buffer size must be at least 4.")
+        self.max_buffers = max_buffers
+        self.max_buffer_size = max_buffer_size
+        self.buffers = []
+
+    def acquire(self, size):
+        """Return a buffer of at least *size* bytes."""
+        for (i, buf) in enumerate(self.buffers):
+            if len(buf) >= size:
+                return self.buffers.pop(i)
+        return bytearray(size)
+
+    def release(self, buf):
+        """Return a buffer to the pool once it is no longer used."""
+        if (len(self.buffers) < self.max_buffers and
+                len(buf) <= self.max_buffer_size):
+            self.buffers.append(buf)
+
+
+class BoundedReader(object):
+    """Readable file-like object that enforces the limits of a Limits
+    instance *limits* on the typed bytes read from a readable file-like
+    object *fp*.
+
+    Sequences of bytes and strings are read with the ``readinto()``
+    method of *fp* when it has one, in chunks of at most
+    ``read_chunk_size`` bytes. Strings are decoded from buffers of a
+    BufferPool instance *pool*, one buffer at a time if they are larger
+    than its maximum buffer size."""
+
+    def __init__(self, fp, limits, pool=None):
+        if pool is None:
+            pool = BufferPool()
+        self.fp = fp
+        self.limits = limits
+        self.pool = pool
+        self.record_size = 0
+
+    def start_record(self):
+        """Start counting the bytes of a new top-level object."""
+        self.record_size = 0
+
+    def count(self, size):
+        limit = self.limits.record_size
+        self.record_size += size
+        if limit is not None and self.record_size > limit:
+            raise LimitExceededError(
+                "Record size exceeds the limit of %d bytes." % limit)
+
+    def check_element_size(self, size):
+        limit = self.limits.element_size
+        if limit is not None and size > limit:
+            raise LimitExceededError(
+                "Element size %d exceeds the limit of %d bytes." %
+                (size, limit))
+
+    def check_container_length(self, length):
+        limit = self.limits.container_length
+        if limit is not None and length > limit:
+            raise LimitExceededError(
+                "Container length %d exceeds the limit of %d." %
+                (length, limit))
+
+    def read(self, size):
+        self.count(size)
+        return self.fp.read(size)
+
+    def readinto_exactly(self, view):
+        """Fill the writeable ``memoryview`` *view* with bytes read from
+        the underlying file-like object.
+
+        This method raises EOFError if not enough bytes can be read. The
+        bytes must already have been counted with ``count()``."""
+        size = len(view)
+        readinto = getattr(self.fp, "readinto", None)
+        offset = 0
+        while offset < size:
+            end = min(offset + read_chunk_size, size)
+            if readinto is not None:
+                n = readinto(view[offset:end])
+            else:
+                string = self.fp.read(end - offset)
+                n = len(string)
+                view[offset:offset + n] = string
+            if not n:
+                raise EOFError(
+                    "Not enough bytes were read from the file-like readable.")
+            offset += n
+
+    def read_bytearray(self, size):
+        """Read a ``bytearray`` instance of *size* bytes."""
+        self.check_element_size(size)
+        self.count(size)
+        buf = bytearray(size)
+        self.readinto_exactly(memoryview(buf))
+        return buf
+
+    def read_unicode(self, size):
+        """Read *size* bytes and decode them from UTF-8 to a ``unicode``
+        instance, through a pooled buffer.
+
+        Strings larger than the buffer are read and decoded one buffer
+        at a time."""
+        self.check_element_size(size)
+        self.count(size)
+        buf = self.pool.acquire(min(size, self.pool.max_buffer_size))
+        view = memoryview(buf)
+        pieces = []
+        # Number of bytes of a partial character, which are kept at the
+        # start of the buffer until the rest of it is read.
+        pending = 0
+        remaining = size
+        try:
+            while True:
+                n = min(len(buf) - pending, remaining)
+                self.readinto_exactly(view[pending:pending + n])
+                remaining -= n
+                end = pending + n
+                (text, consumed) = utf_8_decode(
+                    buffer(buf, 0, end), "strict", not remaining)
+                pieces.append(text)
+                pending = end - consumed
+                view[:pending] = buf[consumed:end]
+                if not remaining:
+                    return u"".join(pieces)
+        finally:
+            self.pool.release(buf)
+
+
+def check_element_size(fp, size):
+    """Raise LimitExceededError if *fp* is a BoundedReader instance
+    whose element size limit is less than *size*."""
+    if isinstance(fp, BoundedReader):
+        fp.check_element_size(size)
+
+
+def check_container_length(fp, length):
+    """Raise LimitExceededError if *fp* is a BoundedReader instance
+    whose container length limit is less than *length*."""
+    if isinstance(fp, BoundedReader):
+        fp.check_container_length(length)
+
+
 class Type(namedtuple("Type", ["code", "type", "load", "dump"])):
     """Type definition for Hadoop typed bytes."""
 
@@ -92,11 +410,17 @@ def isclassinfo(classinfo):
         return isinstance(classinfo, (type, ClassType))
 
 
-def load(fp, types=None):
+def load(fp, types=None, limits=None):
     """Deserialize a readable file-like object *fp* to a Python
-    object."""
+    object.
+
+    If *limits* is a Limits instance, this function raises
+    LimitExceededError when the serialized object exceeds one of its
+    limits."""
     if types is None:
         types = default_types
+    if limits is not None:
+        fp = BoundedReader(fp, limits)
     type_code = load_type_code(fp)
     for t in types:
         if t.code == type_code:
@@ -107,21 +431,27 @@ def load(fp, types=None):
     return obj
 
 
-def loads(s, types=None):
+def loads(s, types=None, limits=None):
     """Deserialize a sequence of bytes *s* to a Python object."""
     fp = StringIO(s)
-    return load(fp, types)
+    return load(fp, types, limits)
 
 
-def iterload(fp, types=None):
+def iterload(fp, types=None, limits=None):
     """Generator function that deserializes Python objects from a
     readable file-like object *fp*.
 
     The returned iterator raises ``StopIteration`` when it encounters a
-    0xff byte."""
+    0xff byte. If *limits* is a Limits instance, each object is subject
+    to its limits, as with ``load``."""
     if types is None:
         types = default_types
+    reader = None
+    if limits is not None:
+        fp = reader = BoundedReader(fp, limits)
     while True:
+        if reader is not None:
+            reader.start_record()
         try:
             obj = load(fp, types)
         except EOFError:
@@ -131,11 +461,124 @@ def iterload(fp, types=None):
         yield obj
 
 
+def iterpairs(keys, next_value):
+    """Generator function that pairs each key of the iterator *keys*
+    with the value returned by calling *next_value*.
+
+    This function raises EOFError if *next_value* raises EOFError or
+    StopIteration, since the key/value stream then ended after a
+    key."""
+    for key in keys:
+        try:
+            value = next_value()
+        except (EOFError, StopIteration):
+            raise EOFError("Key/value stream ended after a key.")
+        yield (key, value)
+
+
+def iterload_pairs(fp, key_types=None, value_types=None):
+    """Return an iterator over the (key, value) pairs deserialized from
+    a key/value stream read from a readable file-like object *fp*.
+
+    Keys are deserialized with *key_types* and values with
+    *value_types*. For example, ``value_types=raw_types()`` returns
+    each value as a RawTypedBytes instance.
+
+    The iterator raises EOFError if *fp* ends after a key."""
+    return iterpairs(iterload(fp, key_types), lambda: load(fp, value_types))
+
+
+def raw_types(depth=0, types=None):
+    """Return type definitions that deserialize values nested *depth*
+    levels deep in containers as RawTypedBytes instances.
+
+    With a depth of 0, every value is returned raw. With a depth of 1,
+    the elements of a top-level vector, list or map are returned raw,
+    and so on. Values nearer the top are deserialized with *types*.
+    Raw values are read with ``read_raw_body``, so application-specific
+    type codes must follow the typed bytes convention for codes 50 to
+    200."""
+    if types is None:
+        types = default_types
+    if depth < 0:
+        raise ValueError("Depth must be non-negative.")
+    if depth == 0:
+        return tuple(
+            t if t.code == 255 else t._replace(load=raw_loader(t.code))
+            for t in types)
+    nested_types = raw_types(depth - 1, types)
+    return tuple(
+        t._replace(load=nested_loader(t.load, nested_types))
+        for t in types)
+
+
+def raw_loader(type_code):
+    """Return a load function that reads the subsequent bytes of a
+    value with type code *type_code* as a RawTypedBytes instance."""
+    header = chr(type_code)
+    def load_raw_typed_bytes(fp, types=None):
+        chunks = [header]
+        read_raw_body(type_code, fp, chunks)
+        return RawTypedBytes("".join(chunks))
+    return load_raw_typed_bytes
+
+
+def nested_loader(load_function, nested_types):
+    """Return a load function that calls *load_function* with
+    *nested_types* for the values nested in it."""
+    def load_nested(fp, types=None):
+        return load_function(fp, nested_types)
+    return load_nested
+
+
+def streaming_types(types=None):
+    """Return type definitions that deserialize vectors, lists and maps
+    as container streams whose elements are read from the stream as
+    they are iterated.
+
+    Elements are deserialized recursively with the returned type
+    definitions, so nested containers are streamed too. The keys of maps
+    are deserialized with *types*, and are thus held in memory. Advancing
+    a container stream consumes whatever remains of its previous
+    element, so elements must be used before the next one is read."""
+    if types is None:
+        types = default_types
+    def load_map_stream_with_keys(fp, nested_types=None):
+        return load_map_stream(fp, nested_types, types)
+    loaders = {
+        8: load_vector_stream,
+        9: load_list_stream,
+        10: load_map_stream_with_keys,
+        }
+    return tuple(
+        t._replace(load=loaders[t.code]) if t.code in loaders else t
+        for t in types)
+
+
+def iterload_streaming(fp, types=None):
+    """Generator function that deserializes Python objects from a
+    readable file-like object *fp*, returning vectors, lists and maps as
+    container streams.
+
+    Each container stream is consumed before the next object is read.
+    See ``streaming_types``."""
+    for obj in iterload(fp, streaming_types(types)):
+        yield obj
+        skip_stream(obj)
+
+
 def dump(obj, fp, types=None):
     """Serialize *obj* to a writeable file-like object *fp*, flushing
-    the output buffer after write."""
+    the output buffer after write.
+
+    RawTypedBytes instances are written verbatim, whatever *types*
+    is."""
     if types is None:
         types = default_types
+    if isinstance(obj, RawTypedBytes):
+        fp.write(obj.data)
+        fp.flush()
+        return
     for td in types:
         if isinstance(obj, td.type):
             dump_type_code(td.code, fp)
@@ -173,6 +616,115 @@ def iterdump(fp, types=None):
     return cr
 
 
+# Number of subsequent bytes for type codes of fixed size.
+fixed_sizes = {1: 1, 2: 1, 3: 4, 4: 8, 5: 4, 6: 8, 255: 0}
+
+
+# Type codes whose subsequent bytes are a size followed by as many
+# bytes as indicated by the size.
+sized_type_codes = set([0, 7]) | application_type_codes
+
+
+def read_exactly(fp, size):
+    """Read exactly *size* bytes from a readable file-like object *fp*.
+
+    This function raises EOFError if not enough bytes can be read from
+    *fp*."""
+    string = fp.read(size)
+    if len(string) != size:
+        raise EOFError(
+            "Not enough bytes were read from the file-like readable.")
+    return string
+
+
+def read_raw(fp, chunks):
+    """Read the typed bytes sequence of one value from a readable
+    file-like object *fp* without deserializing it.
+
+    The bytes are appended to the list *chunks* and the type code of the
+    value is returned. Only the type codes of the typed bytes
+    documentation are recognized; the type codes 50 to 200 are treated
+    as aliases for 0. This function raises ValueError if it encounters
+    any other type code."""
+    header = read_exactly(fp, 1)
+    chunks.append(header)
+    type_code = ord(header)
+    read_raw_body(type_code, fp, chunks)
+    return type_code
+
+
+def read_raw_body(type_code, fp, chunks):
+    """Read the subsequent bytes of a value whose type code *type_code*
+    has already been read from a readable file-like object *fp*,
+    appending them to the list *chunks*.
+
+    See ``read_raw`` for the recognized type codes."""
+    if type_code in fixed_sizes:
+        chunks.append(read_exactly(fp, fixed_sizes[type_code]))
+    elif type_code in sized_type_codes:
+        size = read_raw_size(fp, chunks)
+        check_element_size(fp, size)
+        chunks.append(read_exactly(fp, size))
+    elif type_code == 8:
+        size = read_raw_size(fp, chunks)
+        check_container_length(fp, size)
+        for _ in xrange(size):
+            read_raw(fp, chunks)
+    elif type_code == 9:
+        length = 0
+        while read_raw(fp, chunks) != 255:
+            length += 1
+            check_container_length(fp, length)
+    elif type_code == 10:
+        size = read_raw_size(fp, chunks)
+        check_container_length(fp, size)
+        for _ in xrange(2 * size):
+            read_raw(fp, chunks)
+    else:
+        raise ValueError("Unrecognized type code: %d" % type_code)
+
+
+def read_raw_size(fp, chunks):
+    """Read a size from a readable file-like object *fp*, appending its
+    bytes to the list *chunks*, and return it as an ``int``."""
+    string = read_exactly(fp, int_struct.size)
+    chunks.append(string)
+    size = int_struct.unpack(string)[0]
+    if size < 0:
+        raise ValueError("%d is not a valid size" % size)
+    return size
+
+
+def load_raw(fp):
+    """Read the typed bytes sequence of one value from a readable
+    file-like object *fp* and return it as a ``str`` instance, without
+    deserializing it."""
+    chunks = []
+    read_raw(fp, chunks)
+    return "".join(chunks)
+
+
+def iterload_raw(fp):
+    """Generator function that reads the typed bytes sequences of
+    successive values from a readable file-like object *fp* without
+    deserializing them.
+
+    The returned iterator raises ``StopIteration`` at the end of *fp* or
+    when it encounters a 0xff byte. Unlike ``iterload``, it raises
+    EOFError if *fp* ends in the middle of a value."""
+    while True:
+        chunks = []
+        try:
+            type_code = read_raw(fp, chunks)
+        except EOFError:
+            if chunks:
+                raise
+            raise StopIteration
+        if type_code == 255:
+            raise StopIteration
+        yield "".join(chunks)
+
+
 def load_type_code(fp):
     """Deserialize a type code from a readable file-like object *fp*.
 
@@ -230,6 +782,8 @@ def load_bytes(fp, types=None):
         <as many bytes as indicated by the integer>
     """
     size = load_size(fp)
+    if isinstance(fp, BoundedReader):
+        return fp.read_bytearray(size)
     return bytearray(fp.read(size))
 
 
@@ -389,7 +943,7 @@ def dump_long(obj, fp, types=None):
     long_struct.pack_write(fp, obj)
 
 
-def load_float(read, types=None):
+def load_float(fp, types=None):
     """Deserialize a ``float`` instance from a readable file-like object
     *fp*.
 
@@ -399,7 +953,7 @@ def load_float(read, types=None):
     return float_struct.unpack_read(fp)[0]
 
 
-def dump_float(write, obj, types=None):
+def dump_float(obj, fp, types=None):
     """Serialize a 32-bit floating point number *obj* to a writeable
     file-like object *fp*.
 
@@ -414,13 +968,27 @@ def dump_float(write, obj, types=None):
     if (not isnan(coerced_obj)) and (coerced_obj != obj):
         raise TypeError(
             "Object must be coercible to float without loss of information.")
-    # Check for loss of precision when packing as a 32-bit signed IEEE
-    # floating point number.
-    string = float_struct.pack(obj)
-    if float_struct.unpack(string) != (obj,):
+    if not is_exact_float(coerced_obj):
         raise TypeError(
             "Object must be exactly representable as a 32-bit signed float.")
-    fp.write(string)
+    float_struct.pack_write(fp, coerced_obj)
+
+
+def is_exact_float(obj):
+    """Test whether the ``float`` instance *obj* is exactly representable
+    as a 32-bit signed IEEE floating point number.
+
+    NaN is considered exactly representable, because it round-trips as
+    NaN."""
+    if isnan(obj):
+        return True
+    try:
+        string = float_struct.pack(obj)
+    except OverflowError:
+        return False
+    # Check for loss of precision when packing as a 32-bit signed IEEE
+    # floating point number.
+    return float_struct.unpack(string) == (obj,)
 
 
 def load_double(fp, types=None):
@@ -456,6 +1024,9 @@ def load_string(fp, types=None):
         <big-endian 32-bit signed integer>
         <as many UTF-8 bytes as indicated by the integer>
     """
+    if isinstance(fp, BoundedReader):
+        size = load_size(fp)
+        return fp.read_unicode(size)
     raw = load_bytes(fp)
     return raw.decode('utf_8')
 
@@ -485,6 +1056,7 @@ def load_vector(fp, types=None):
     The elements of the tuple are recursively deserialized.
     """
     size = load_size(fp)
+    check_container_length(fp, size)
     deserializer = iterload(fp, types)
     return tuple(islice(deserializer, size))
 
@@ -514,7 +1086,13 @@ def load_list(fp, types=None):
         <255 written as an unsigned byte, marking the end of the list>
     The elements of the list are recursively deserialized.
     """
-    return list(iterload(fp, types))
+    if not isinstance(fp, BoundedReader):
+        return list(iterload(fp, types))
+    obj = []
+    for element in iterload(fp, types):
+        obj.append(element)
+        fp.check_container_length(len(obj))
+    return obj
 
 
 def dump_list(obj, fp, types=None):
@@ -543,6 +1121,7 @@ def load_map(fp, types=None):
     The items of the dict are recursively deserialized.
     """
     size = load_size(fp)
+    check_container_length(fp, size)
     deserializer = iterload(fp, types)
     def key_value_pair():
         key = deserializer.next()
@@ -568,6 +1147,107 @@ def dump_map(obj, fp, types=None):
         serializer.send(v)
 
 
+def load_vector_stream(fp, types=None):
+    """Deserialize a VectorStream instance from a readable file-like
+    object *fp*.
+
+    This function calls the ``read()`` method of *fp* to read 4 bytes
+    that contain the size of the vector. The elements are deserialized
+    as the returned stream is iterated."""
+    size = load_size(fp)
+    check_container_length(fp, size)
+    def elements():
+        obj = None
+        for _ in xrange(size):
+            skip_stream(obj)
+            obj = load(fp, types)
+            yield obj
+        skip_stream(obj)
+    return VectorStream(size, elements())
+
+
+def dump_vector_stream(obj, fp, types=None):
+    """Serialize a VectorStream instance *obj* to a writeable file-like
+    object *fp*.
+
+    The elements are serialized as they are produced. This function
+    raises a ValueError if the number of elements differs from the size
+    of *obj*, in which case the output is incomplete."""
+    dump_size(obj.size, fp)
+    serializer = iterdump(fp, types)
+    count = 0
+    for element in obj:
+        if count == obj.size:
+            raise ValueError("Vector stream has more elements than its size.")
+        serializer.send(element)
+        count += 1
+    if count != obj.size:
+        raise ValueError("Vector stream has fewer elements than its size.")
+
+
+def load_list_stream(fp, types=None):
+    """Deserialize a ListStream instance from a readable file-like
+    object *fp*.
+
+    The elements are deserialized as the returned stream is iterated,
+    until the end of the list is read."""
+    def elements():
+        obj = None
+        length = 0
+        while True:
+            skip_stream(obj)
+            obj = load(fp, types)
+            if isinstance(obj, EndOfList):
+                break
+            length += 1
+            check_container_length(fp, length)
+            yield obj
+    return ListStream(elements())
+
+
+def load_map_stream(fp, types=None, key_types=None):
+    """Deserialize a MapStream instance from a readable file-like object
+    *fp*.
+
+    This function calls the ``read()`` method of *fp* to read 4 bytes
+    that contain the size of the map. The (key, value) pairs are
+    deserialized as the returned stream is iterated; keys are
+    deserialized with *key_types*, which defaults to *types*."""
+    if key_types is None:
+        key_types = types
+    size = load_size(fp)
+    check_container_length(fp, size)
+    def items():
+        value = None
+        for _ in xrange(size):
+            skip_stream(value)
+            key = load(fp, key_types)
+            value = load(fp, types)
+            yield (key, value)
+        skip_stream(value)
+    return MapStream(size, items())
+
+
+def dump_map_stream(obj, fp, types=None):
+    """Serialize a MapStream instance *obj* to a writeable file-like
+    object *fp*.
+
+    The (key, value) pairs are serialized as they are produced. This
+    function raises a ValueError if the number of pairs differs from
+    the size of *obj*, in which case the output is incomplete."""
+    dump_size(obj.size, fp)
+    serializer = iterdump(fp, types)
+    count = 0
+    for (k, v) in obj:
+        if count == obj.size:
+            raise ValueError("Map stream has more items than its size.")
+        serializer.send(k)
+        serializer.send(v)
+        count += 1
+    if count != obj.size:
+        raise ValueError("Map stream has fewer items than its size.")
+
+
 # Default serializations defined in typed bytes documentation.
 default_types = (
     Type(255, EndOfList, load_end_of_list, dump_end_of_list),
@@ -586,4 +1266,44 @@ default_types = (
     Type(8, tuple, load_vector, dump_vector),
     Type(9, list, load_list, dump_list),
     Type(10, dict, load_map, dump_map),
+    # Container streams are serialized like the containers, but are
+    # only deserialized by loaders built with ``streaming_types``.
+    Type(8, VectorStream, load_vector, dump_vector_stream),
+    Type(9, ListStream, load_list, dump_list),
+    Type(10, MapStream, load_map, dump_map_stream),
     )
+
+
+def compact_numeric_types(types=None):
+    """Return type definitions derived from *types* that serialize
+    numbers with the smallest type code that represents them exactly.
+
+    The definition for ``int`` is replaced by definitions for integers
+    that fit in a byte (code 1), in a 32-bit integer (code 3) and in a
+    64-bit long (code 4), and the definition for ``long`` is dropped.
+    The definition for ``float`` is preceded by one for floats that are
+    exactly representable in 32 bits (code 5). All other definitions
+    are kept in order, and deserialization is unchanged."""
+    if types is None:
+        types = default_types
+    compact = []
+    for t in types:
+        if t.code == 3 and t.type is int:
+            compact.extend([
+                Type(1, CompactByte, load_byte, dump_byte),
+                Type(3, CompactInteger, load_integer, dump_integer),
+                Type(4, (int, long), load_long, dump_long),
+                ])
+        elif t.code == 4 and t.type is long:
+            continue
+        elif t.code == 6 and t.type is float:
+            compact.extend([Type(5, CompactFloat, load_float, dump_float), t])
+        else:
+            compact.append(t)
+    return tuple(compact)
+
+
+# Serializations that write numbers with the smallest type code that
+# represents them exactly. Typed bytes written with these definitions
+# can be read with ``default_types``.
+compact_types = compact_numeric_types(default_types)